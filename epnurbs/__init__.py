@@ -1,3 +1,6 @@
 from .createnurbsshading import createnurbsshading
 from .createnurbsopening import createnurbsopening
 from .createrectshading import createrectshading
+from .surfaceoverlap import checkoverlaps
+from .createlouvershading import createlouvershading
+from .approximationquality import nurbsshadingquality, nurbsopeningquality
@@ -0,0 +1,244 @@
+# epnurbs.approximationquality module contains methods for measuring how well the surfaces
+# created by createnurbsshading and createnurbsopening approximate the exact NURBS shapes
+
+from .helper_methods import normalize, polygonnormal, polygonarea, firstedge
+from .surfaceoutput import loadbasesurface
+
+# number of Gauss-Legendre points used on each knot span of a NURBS curve
+quadrature_points = 16
+
+# number of curve points per knot span used for measuring the edge deviation
+edge_samples = 64
+
+# the method for measuring the quality of approximation of a NURBS shading by createnurbsshading.
+# it takes the same arguments as createnurbsshading, but it does not change the file.
+# returns the dictionary with the exact area of the NURBS shading, the total area of the emitted surfaces,
+# their relative area error, the largest distance between the NURBS curve and the outer edges of the surfaces,
+# and the number of surfaces.
+def nurbsshadingquality(idd_filename, idf_filename, base_surface, ctrl_points, evaluated_points=20, merge_tolerance=None):
+    from .createnurbsshading import nurbsshadingsurfaces
+    from .surfacemerge import mergecoplanarsurfaces
+
+    model, coord = loadbasesurface(idd_filename, idf_filename, base_surface, 'nurbsshadingquality')
+    if model is None:
+        return
+
+    surfaces = list(nurbsshadingsurfaces(coord, [list(cpt) for cpt in ctrl_points], evaluated_points))
+    if merge_tolerance is not None:
+        surfaces = mergecoplanarsurfaces(surfaces, merge_tolerance)
+
+    quality = shadingquality(coord, ctrl_points, surfaces)
+    printquality('nurbsshadingquality', base_surface, quality)
+    return quality
+
+# the method for measuring the quality of approximation of a NURBS opening by createnurbsopening.
+# it takes the same arguments as createnurbsopening, but it does not change the file.
+# returns the same dictionary as nurbsshadingquality, where the edge deviation is measured
+# between the NURBS curve and the outline of the union of the emitted rectangles.
+def nurbsopeningquality(idd_filename, idf_filename, base_surface, ctrl_points, evaluated_points=50):
+    from .createnurbsopening import nurbsopeningsurfaces
+
+    model, coord = loadbasesurface(idd_filename, idf_filename, base_surface, 'nurbsopeningquality')
+    if model is None:
+        return
+
+    surfaces = list(nurbsopeningsurfaces(coord, [list(cpt) for cpt in ctrl_points], evaluated_points))
+
+    quality = openingquality(coord, ctrl_points, surfaces)
+    printquality('nurbsopeningquality', base_surface, quality)
+    return quality
+
+def printquality(caller, base_surface, quality):
+    print('epnurbs.'+caller+':', base_surface, '-', quality['surface_count'], 'surfaces,',
+          'area {:.4f} of exact {:.4f} ({:+.2%}),'.format(quality['surface_area'], quality['exact_area'], quality['area_error']),
+          'edge deviation {:.4f}'.format(quality['edge_deviation']))
+
+# quality of the shading surfaces for the base surface with coordinates coord,
+# where ctrl_points are the control points as given to createnurbsshading
+def shadingquality(coord, ctrl_points, surfaces):
+    import numpy as np
+
+    # the same curve as in nurbsshadingsurfaces: degree 3 with clamped uniform knot vector over [0, 1]
+    ctrlpts = weightedpoints(ctrl_points)
+    degree = 3
+    inner = len(ctrlpts) - degree
+    knots = np.concatenate([np.zeros(degree), np.linspace(0, 1, inner+1), np.ones(degree)])
+
+    ulc, N = wallplane(coord)
+
+    # the shading is the ruled surface between the curve C(t) and its foot F(t) on the wall,
+    # whose area is the integral of |h(t)| |F'(t)|, where h(t) is the distance of C(t) from the wall
+    t, weights = quadrature(knots, degree, 0.0, 1.0)
+    C, dC = nurbscurve(ctrlpts, knots, degree, t)
+    h = np.dot(C - ulc, N)
+    dF = dC - np.outer(np.dot(dC, N), N)
+    exact_area = np.sum(weights * np.abs(h) * np.linalg.norm(dF, axis=1))
+
+    # the curve is compared with all edges of the surfaces that do not lie on the wall,
+    # including the arms and the sides of triangles at places where the curve meets the wall,
+    # while only the outer edges that do not touch the wall are compared with the curve
+    edges = []
+    outer_edges = []
+    for idx, vertices, countervertices in surfaces:
+        vertices = np.asarray(vertices, dtype=float)
+        off_wall = np.abs(np.dot(vertices - ulc, N))>1e-6
+        for k in range(len(vertices)):
+            if off_wall[k] or off_wall[k-1]:
+                edges.append( (vertices[k-1], vertices[k]) )
+            if off_wall[k] and off_wall[k-1]:
+                outer_edges.append( (vertices[k-1], vertices[k]) )
+
+    curve = nurbscurve(ctrlpts, knots, degree, samples(knots, degree, 0.0, 1.0))[0]
+    edge_deviation = polylinedeviation(curve, edges, outer_edges)
+
+    return qualityreport(exact_area, surfaces, edge_deviation)
+
+# quality of the opening surfaces for the base surface with coordinates coord,
+# where ctrl_points are the control points as given to createnurbsopening
+def openingquality(coord, ctrl_points, surfaces):
+    import numpy as np
+
+    # the same closed curve as in nurbsopeningsurfaces: degree 3 with the first three control points
+    # repeated at the end and uniform knot vector, evaluated over [knots[degree], knots[len(ctrlpts)]]
+    ctrlpts = weightedpoints(ctrl_points)
+    degree = 3
+    ctrlpts = np.vstack([ctrlpts, ctrlpts[:degree]])
+    knots = np.linspace(0, 1, len(ctrlpts)+degree+1)
+    start = knots[degree]
+    stop = knots[len(ctrlpts)]
+
+    # the uv system of the wall, as in nurbsopeningsurfaces
+    ulc, N = wallplane(coord)
+    u = np.array(normalize(firstedge(coord)))
+    v = np.cross(N, u)
+    uv = np.array([u, v]).T
+
+    # area of the region bounded by the feet of the curve points on the wall,
+    # as the integral of (x y' - y x')/2 in uv system
+    t, weights = quadrature(knots, degree, start, stop)
+    C, dC = nurbscurve(ctrlpts, knots, degree, t)
+    P = np.dot(C - ulc, uv)
+    dP = np.dot(dC, uv)
+    exact_area = abs(np.sum(weights * (P[:, 0]*dP[:, 1] - P[:, 1]*dP[:, 0]))/2)
+
+    # outline of the union of the emitted rectangles consists of those edges of 0.1m squares
+    # that separate the squares covered by the rectangles from the remaining ones
+    squaresize = 0.1
+    cells = set()
+    for idx, vertices, countervertices in surfaces:
+        corners = np.dot(np.asarray(vertices, dtype=float) - ulc, uv)/squaresize - 0.5
+        i = int(round(corners[:, 0].min()))
+        for j in range(int(round(corners[:, 1].min())), int(round(corners[:, 1].max()))):
+            cells.add( (i, j) )
+
+    outline = []
+    for i, j in cells:
+        # each edge is given by its two corners in uv system, in units of squaresize
+        for neighbour, a, b in [ ((i-1, j), (i, j), (i, j+1)), ((i+1, j), (i+1, j), (i+1, j+1)),
+                                 ((i, j-1), (i, j), (i+1, j)), ((i, j+1), (i, j+1), (i+1, j+1)) ]:
+            if neighbour not in cells:
+                outline.append( ((np.array(a)+0.5)*squaresize, (np.array(b)+0.5)*squaresize) )
+
+    curve = np.dot(nurbscurve(ctrlpts, knots, degree, samples(knots, degree, start, stop))[0] - ulc, uv)
+    edge_deviation = polylinedeviation(curve, outline, outline)
+
+    return qualityreport(exact_area, surfaces, edge_deviation)
+
+def qualityreport(exact_area, surfaces, edge_deviation):
+    surface_area = sum(polygonarea(vertices) for idx, vertices, countervertices in surfaces)
+    return { 'exact_area': float(exact_area),
+             'surface_area': float(surface_area),
+             'area_error': float((surface_area - exact_area)/exact_area) if exact_area>0 else 0.0,
+             'edge_deviation': float(edge_deviation),
+             'surface_count': len(surfaces) }
+
+# the wall point ulc and the normalised wall normal, found from all wall vertices
+# as in createnurbsopening, so that the first three vertices may be collinear
+def wallplane(coord):
+    import numpy as np
+    ulc = coord[0]
+    N = polygonnormal(coord)
+    return np.asarray(ulc, dtype=float), np.array(normalize(N))
+
+# control points as an n x 4 array of weighted points (w*x, w*y, w*z, w),
+# where points without weight get weight 1, as in the generators
+def weightedpoints(ctrl_points):
+    import numpy as np
+    return np.array([ list(cpt) + [1.0] if len(cpt)<4 else list(cpt) for cpt in ctrl_points ], dtype=float)
+
+# Gauss-Legendre nodes and weights on all nonempty knot spans within [start, stop]
+def quadrature(knots, degree, start, stop):
+    import numpy as np
+    x, w = np.polynomial.legendre.leggauss(quadrature_points)
+    spans = np.unique(np.clip(knots, start, stop))
+    a = spans[:-1, None]
+    b = spans[1:, None]
+    return ((a+b)/2 + (b-a)/2*x).ravel(), ((b-a)/2*w).ravel()
+
+# equally spaced parameters on all nonempty knot spans within [start, stop], including both ends
+def samples(knots, degree, start, stop):
+    import numpy as np
+    spans = np.unique(np.clip(knots, start, stop))
+    t = np.linspace(spans[:-1], spans[1:], edge_samples, endpoint=False, axis=1).ravel()
+    return np.append(t, stop)
+
+# B-spline basis functions of the given degree and their derivatives at parameters t,
+# calculated by Cox-de Boor recursion for all parameters at once.
+# returns two len(t) x (len(knots)-degree-1) arrays
+def bsplinebasis(knots, degree, t):
+    import numpy as np
+    knots = np.asarray(knots, dtype=float)
+
+    # the last parameter of the domain belongs to the last nonempty span
+    last = np.nonzero(knots[1:]>knots[:-1])[0][-1]
+    t = np.minimum(t, knots[last+1] - 1e-12*(knots[-1]-knots[0]))
+
+    N = ((t[:, None]>=knots[None, :-1]) & (t[:, None]<knots[None, 1:])).astype(float)
+    dN = np.zeros_like(N)
+    for p in range(1, degree+1):
+        left = knots[p:-1] - knots[:-p-1]
+        right = knots[p+1:] - knots[1:-p]
+        left = np.where(left>0, 1/np.where(left>0, left, 1), 0)
+        right = np.where(right>0, 1/np.where(right>0, right, 1), 0)
+        dN = p*(N[:, :-1]*left - N[:, 1:]*right)
+        N = (t[:, None]-knots[None, :-p-1])*left*N[:, :-1] + (knots[None, p+1:]-t[:, None])*right*N[:, 1:]
+    return N, dN
+
+# points and first derivatives of the NURBS curve with weighted control points ctrlpts at parameters t
+def nurbscurve(ctrlpts, knots, degree, t):
+    import numpy as np
+    N, dN = bsplinebasis(knots, degree, t)
+    A = np.dot(N, ctrlpts)
+    dA = np.dot(dN, ctrlpts)
+    C = A[:, :3]/A[:, 3:]
+    dC = (dA[:, :3] - dA[:, 3:]*C)/A[:, 3:]
+    return C, dC
+
+# Hausdorff-style deviation between the densely sampled curve (array of points) and the lists of edges:
+# the largest distance from a curve point to its nearest edge from edges,
+# or from a point of an edge from outer_edges to the curve polyline
+def polylinedeviation(curve, edges, outer_edges):
+    import numpy as np
+    if len(edges)==0 or len(outer_edges)==0:
+        return float('inf')
+
+    a = np.array([e[0] for e in edges], dtype=float)
+    b = np.array([e[1] for e in edges], dtype=float)
+    outer_a = np.array([e[0] for e in outer_edges], dtype=float)
+    outer_b = np.array([e[1] for e in outer_edges], dtype=float)
+    edge_points = np.concatenate([outer_a, (outer_a+outer_b)/2, outer_b])
+
+    return max(np.max(segmentdistance(curve, a, b)),
+               np.max(segmentdistance(edge_points, curve[:-1], curve[1:])))
+
+# distances of points to the nearest of the segments a[k]-b[k], processed in chunks to bound the memory
+def segmentdistance(points, a, b):
+    import numpy as np
+    ab = b - a
+    ab2 = np.maximum(np.sum(ab*ab, axis=1), 1e-24)
+    distances = []
+    for chunk in range(0, len(points), 1024):
+        ap = points[chunk:chunk+1024, None, :] - a[None, :, :]
+        s = np.clip(np.sum(ap*ab, axis=2)/ab2, 0.0, 1.0)
+        distances.append(np.min(np.linalg.norm(ap - s[:, :, None]*ab, axis=2), axis=1))
+    return np.concatenate(distances)
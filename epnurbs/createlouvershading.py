@@ -0,0 +1,87 @@
+# epnurbs.createlouvershading module contains a method for creating a grid of louvers in EnergyPlus files
+
+from .helper_methods import crossproduct, normalize, foot
+from .surfaceoutput import loadbasesurface, appendsurfaces
+
+# the method for creating a grid of louvers, i.e., several rows of rectangular shadings
+# with the same layout as in createrectshading.
+# the first row lies between the start and the end points, which are projected on the base_surface first,
+# and each of the remaining rows is moved for row_spacing further along the base_surface
+# in the direction perpendicular to the line from the start to the end point
+# (downwards, when the start point is on the left and the end point on the right of the wall seen from outside).
+# depths is either a list of depths of louvers in a single row, shared by all rows,
+# or a list of such lists, one for each row, in which case the number of rows is taken from depths.
+# each louver is tilted for tilt degrees from the base_surface normal around its wall edge,
+# where positive angles turn the louvers downwards in the above sense.
+# the generated surfaces are appended to the file as they are generated, row by row, and <IDX> in shading_str is replaced by row_louver.
+def createlouvershading(idd_filename, idf_filename, base_surface, shading_str, start_point, end_point, depths,
+                        rows=1, row_spacing=0.5, tilt=0.0):
+    ##########################################
+    # loading base surface data from idf file
+    ##########################################
+    model, coord = loadbasesurface(idd_filename, idf_filename, base_surface, 'createlouvershading')
+    if model is None:
+        return
+
+    surfaces = louvershadingsurfaces(coord, start_point, end_point, depths, rows, row_spacing, tilt)
+
+    ##################################################
+    # append shading objects to the model file in bulk
+    ##################################################
+    appendsurfaces(model, idf_filename, shading_str, base_surface, surfaces, 'Shading:Zone:Detailed')
+
+# the method for calculating vertices of a grid of louvers for the base surface with coordinates coord.
+# vertices of all louvers in a row are calculated at once with numpy arrays.
+# yields an (idx, vertices, countervertices) triple for each louver, row by row
+def louvershadingsurfaces(coord, start_point, end_point, depths, rows=1, row_spacing=0.5, tilt=0.0):
+    import numpy as np
+
+    # getting the base_surface's coordinates
+    ulc = coord[0]
+    blc = coord[1]
+    brc = coord[2]
+
+    # find the base_surface's plane normal and normalize it
+    N = crossproduct( (blc[0]-ulc[0], blc[1]-ulc[1], blc[2]-ulc[2]), \
+                      (brc[0]-ulc[0], brc[1]-ulc[1], brc[2]-ulc[2]) )
+    N = np.array(normalize(N))
+
+    # calculate feet of perpendiculars
+    start_foot = np.array(foot(start_point, ulc, N))
+    end_foot = np.array(foot(end_point, ulc, N))
+
+    # depths of all louvers as a rows x num array
+    depths = np.asarray(depths, dtype=float)
+    if depths.ndim==1:
+        depths = np.tile(depths, (rows, 1))
+    rows, num = depths.shape
+
+    # steps between the start and the end point, and between the rows
+    step = (end_foot - start_foot)/num
+    row_direction = np.cross(step, N)
+    row_direction = row_direction/np.linalg.norm(row_direction)
+
+    # direction of louvers, tilted from the normal around the louver's wall edge
+    angle = np.radians(tilt)
+    louver_direction = np.cos(angle)*N + np.sin(angle)*row_direction
+
+    ####################################################################
+    # calculate vertices of louvers as a num x 4 x 3 array for each row
+    ####################################################################
+
+    # two base_surface vertices are row_start + i*step and row_start + (i+1)*step
+    # the other two vertices are at depths[row, i] distance from the base surface
+    v1 = np.arange(num)[:, None]*step
+    v4 = v1 + step
+    for r in range(rows):
+        row_start = start_foot + r*row_spacing*row_direction
+        offset = depths[r, :, None]*louver_direction
+        vertices = row_start + np.stack([v1, v1+offset, v4+offset, v4], axis=1)
+
+        # we do not have a louver if it is not deep enough
+        louver_idx = np.nonzero(depths[r]>0.01)[0]
+        vertices = vertices[louver_idx]
+        countervertices = vertices[:, ::-1, :]
+
+        for i, v, cv in zip(louver_idx.tolist(), vertices.tolist(), countervertices.tolist()):
+            yield (str(r)+'_'+str(i), v, cv)
@@ -1,9 +1,7 @@
 # epnurbs.createopening module contains a method for creating approximation of a NURBS opening in EnergyPlus files
 
-from eppy import modeleditor
-from eppy.modeleditor import IDF
-
-from .helper_methods import subtract, dotproduct, crossproduct, length, normalize, distance, foot
+from .helper_methods import crossproduct, normalize, foot, polygonnormal, firstedge, clipconvex
+from .surfaceoutput import loadbasesurface, savesurfaces, appendsurfaces
 
 # Modified geomdl.utilities.check_knot_vector method to
 # check if the input knot vector follows the mathematical rules
@@ -31,32 +29,34 @@ def new_check_knot_vector(degree=0, knot_vector=(), control_points_size=0, tol=0
     return ret_val
 
 
-# the method for creating approximation of a NURBS opening
-def createnurbsopening(idd_filename, idf_filename, base_surface, opening_str, ctrl_points, evaluated_points=50):
+# the method for creating approximation of a NURBS opening.
+# idf_filename may also be an .epJSON file, in which case the openings are written to it directly.
+# if append is True, the objects are written directly to the end of idf_filename as they are generated,
+# instead of being copied into the eppy model first, so that the memory used stays bounded.
+def createnurbsopening(idd_filename, idf_filename, base_surface, opening_str, ctrl_points, evaluated_points=50,
+                       append=False):
     ##########################################
     # loading base surface data from idf file 
     ##########################################
-    
-    # check if IDD has been already set
-    try:
-        IDF.setiddname(idd_filename)
-    except modeleditor.IDDAlreadySetError as e:
-        pass
-
-    # load idf file into idf collection
-    idf_collection = IDF(idf_filename)
-
-    # find the named base_surface in idf collection
-    walls = idf_collection.idfobjects['BuildingSurface:Detailed'.upper()]
-    for wall in walls:
-        if wall.Name == base_surface:
-            # named base_surface is now contained in wall
-            break
-    else:
-        # named base_surface was not found in idf file
-        print('epnurbs.createopening: unable to find the base surface', base_surface, 'in', idf_filename)
+    model, coord = loadbasesurface(idd_filename, idf_filename, base_surface, 'createopening')
+    if model is None:
         return
 
+    surfaces = nurbsopeningsurfaces(coord, ctrl_points, evaluated_points)
+
+    ###########################################################
+    # add opening objects to the model and at the end, save it
+    ###########################################################
+    if append:
+        appendsurfaces(model, idf_filename, opening_str, base_surface, surfaces, 'FenestrationSurface:Detailed')
+    else:
+        savesurfaces(model, idf_filename, opening_str, base_surface, surfaces, 'FenestrationSurface:Detailed')
+
+# the method for calculating vertices of rectangles that approximate NURBS opening
+# for the base surface with coordinates coord, which may be any planar polygon, such as a trapezoidal or gable wall.
+# the opening is clipped with the wall first, so that only the squares of the clipped opening are checked.
+# yields an (idx, vertices, countervertices) triple for each opening rectangle
+def nurbsopeningsurfaces(coord, ctrl_points, evaluated_points=50):
     #################################
     # calculating NURBS curve points
     #################################
@@ -103,125 +103,135 @@ def createnurbsopening(idd_filename, idf_filename, base_surface, opening_str, ct
     # just to make sure we are not getting out of its plane
     #########################################################################
 
-    # getting the found base_surface's coordinates
-    coord = wall.coords
+    # getting the base_surface's coordinates
     ulc = coord[0]
-    blc = coord[1]
-    brc = coord[2]
 
-    # find the base_surface's plane normal and normalize it
-    u = [ blc[0]-ulc[0], blc[1]-ulc[1], blc[2]-ulc[2] ]
-    v = [ brc[0]-blc[0], brc[1]-blc[1], brc[2]-blc[2] ]
-    N = crossproduct(u,v)
+    # find the base_surface's plane normal from all of its vertices and normalize it,
+    # since the first three vertices may be collinear
+    N = polygonnormal(coord)
     N = normalize(N)
 
+    # the first edge of the base_surface that is not degenerate gives the direction u
+    u = firstedge(coord)
+
     # calculate feet of perpendiculars
     feet_points = [foot(crv_points[i], ulc, N) for i in range(len(crv_points))]
 
-    #######################################################################################
-    # create a list of 0.1m squares that partition the whole wall surface
-    # !!! it is assumed that the wall surface is a rectangle
-    # !!! three of whose vertices are ulc, blc and brc (and the fourth one is ulc+brc-blc)
-    #######################################################################################
+    ####################################################################################
+    # create a list of 0.1m squares that partition the part of the wall surface
+    # covered by the opening, where the wall surface may be any planar polygon
+    # whose first vertex is ulc
+    ####################################################################################
+    import numpy as np
 
     # a new orthonormal system for the wall surface
     u = normalize(u)
     v = crossproduct(N,u)
     v = normalize(v)
 
-    # transform feet_point coordinates to the uv system
+    # transform feet_point and wall coordinates to the uv system
     # since N, u, v is an orthonormal system we have that
     # for each vector X = <X,N>N + <X,u>u + <X,v>v
-    # this will be applied to vectors feet_points-ulc which belong to the wall surface plane
-    feet_points_uv = [ [dotproduct(subtract(fp, ulc), u),
-                        dotproduct(subtract(fp, ulc), v)] for fp in feet_points]
-
-    # form a list of squares and a list of their centers in uv coordinates
-    squaresize = 0.1
-    maxi = int(length(subtract(blc, ulc))/squaresize)-1
-    maxj = int(length(subtract(brc, blc))/squaresize)-1
+    # this will be applied to vectors feet_points-ulc and coord-ulc which belong to the wall surface plane
+    uv = np.array([u, v]).T
+    feet_points_uv = np.dot(np.array(feet_points) - np.array(ulc), uv)
+    wall_uv = np.dot(np.array(coord, dtype=float) - np.array(ulc), uv)
+
+    # repeated wall vertices make zero-length edges, which are left out
+    edge_lengths = np.linalg.norm(wall_uv - np.roll(wall_uv, 1, axis=0), axis=1)
+    wall_uv = wall_uv[edge_lengths>1e-9]
+
+    # clip the opening with the wall, or with its bounding rectangle if the wall is not convex,
+    # so that only the squares of the clipped opening are considered in openingruns
+    if isconvex(wall_uv):
+        clip_uv = wall_uv.tolist()
+    else:
+        wmin = wall_uv.min(axis=0)
+        wmax = wall_uv.max(axis=0)
+        clip_uv = [wmin, [wmax[0], wmin[1]], wmax, [wmin[0], wmax[1]]]
+    clipped_uv = np.array(clipconvex(feet_points_uv.tolist(), clip_uv), dtype=float)
+    if len(clipped_uv)<3:
+        return
 
-    squarelist = [ [ [ ((i+0.5)*squaresize, (j+0.5)*squaresize), ((i+1.5)*squaresize, (j+0.5)*squaresize),
-                       ((i+1.5)*squaresize, (j+1.5)*squaresize), ((i+0.5)*squaresize, (j+1.5)*squaresize) ]
-                   for j in range(maxj) ]
-                 for i in range(maxi)]
-    squarecenters = [ ( (i+1)*squaresize, (j+1)*squaresize ) for i in range(maxi) for j in range(maxj) ]
+    ###############################################################
+    # yield rectangles that approximate NURBS opening
+    ###############################################################
 
-    # for each square check whether its center belongs to the polygon defined by NURBS curve points
+    # consecutive inside squares within each column form a single opening element,
+    # which is recalculated from uv system to xyz system as ulc + a*u + b*v
+    squaresize = 0.1
+    for i, pn, kn in openingruns(clipped_uv, wall_uv, squaresize):
+        corner_uv = np.stack([ np.column_stack([i+0.5, pn+0.5]), np.column_stack([i+1.5, pn+0.5]),
+                               np.column_stack([i+1.5, kn+1.5]), np.column_stack([i+0.5, kn+1.5]) ], axis=1)*squaresize
+        vertices = np.array(ulc) + np.dot(corner_uv, uv.T)
+        countervertices = vertices[:, [0, 3, 2, 1], :]
+
+        for a, b, vert, countervert in zip(i.tolist(), pn.tolist(), vertices.tolist(), countervertices.tolist()):
+            yield (str(a)+'_'+str(b), vert, countervert)
+
+# the maximum number of squares that openingruns checks at once
+band_squares = 250000
+
+# the method for finding runs of consecutive squares within the opening clipped_uv on the wall wall_uv,
+# both given in uv system of the wall.
+# the square (i,j) has its vertices at ((i+0.5)*squaresize, (j+0.5)*squaresize) and ((i+1.5)*squaresize, (j+1.5)*squaresize),
+# and it is inside if its center belongs to the opening and it lies within the wall, at least half a square away from its edges.
+# the squares are checked in bands of columns, so that at most band_squares squares are kept in memory,
+# and for each band the method yields the arrays i, pn, kn of runs of inside squares (i,pn), ..., (i,kn).
+def openingruns(clipped_uv, wall_uv, squaresize):
+    import numpy as np
     import matplotlib.path as mplPath
-    path = mplPath.Path(feet_points_uv)
-    inside = path.contains_points(squarecenters)
-
-    # select only those squares whose centers are inside the NURBS curve
-    insideindices = [ [ j for j in range(maxj) if inside[i*maxj+j] ] for i in range(maxi) ]
-
-    # now insideindices[i] contains all j such that squarelist[i][j] is inside a NURBS curve
-
-    #################################################################################
-    # create string of idf definitions for rectangles that approximate NURBS opening
-    #################################################################################
-    idf_total_opening_def = ""
-
-    for i in range(maxi):
-        # go through all inside squares within i-th column, if there are any
-        if len(insideindices[i])>0:
-            # pn and kn contain the beginning and the end of
-            # subsequences of consecutive numbers within the insideindices[i] list
-            pn = insideindices[i][0]
-            kn = insideindices[i][0]
-
-            for k in range(1, len(insideindices[i])+1):
-                if k<len(insideindices[i]) and insideindices[i][k]==insideindices[i][k-1]+1:
-                    # consecutive subsequence goes on
-                    kn = insideindices[i][k]
-                else:
-                    # consecutive subsequence had ended, so create an opening element
-                    # squarelist[i][pn][0],[1] contain its first two vertices in uv system,
-                    # squarelist[i][kn][2],[3] contain its last two vertices in uv system
-                    # recalculate vertices in xyz system first
-                    vertex1 = [ ulc[0] + squarelist[i][pn][0][0] * u[0] + squarelist[i][pn][0][1] * v[0],
-                                ulc[1] + squarelist[i][pn][0][0] * u[1] + squarelist[i][pn][0][1] * v[1],
-                                ulc[2] + squarelist[i][pn][0][0] * u[2] + squarelist[i][pn][0][1] * v[2] ]
-                    vertex2 = [ ulc[0] + squarelist[i][pn][1][0] * u[0] + squarelist[i][pn][1][1] * v[0],
-                                ulc[1] + squarelist[i][pn][1][0] * u[1] + squarelist[i][pn][1][1] * v[1],
-                                ulc[2] + squarelist[i][pn][1][0] * u[2] + squarelist[i][pn][1][1] * v[2] ]
-                    vertex3 = [ ulc[0] + squarelist[i][kn][2][0] * u[0] + squarelist[i][kn][2][1] * v[0],
-                                ulc[1] + squarelist[i][kn][2][0] * u[1] + squarelist[i][kn][2][1] * v[1],
-                                ulc[2] + squarelist[i][kn][2][0] * u[2] + squarelist[i][kn][2][1] * v[2] ]
-                    vertex4 = [ ulc[0] + squarelist[i][kn][3][0] * u[0] + squarelist[i][kn][3][1] * v[0],
-                                ulc[1] + squarelist[i][kn][3][0] * u[1] + squarelist[i][kn][3][1] * v[1],
-                                ulc[2] + squarelist[i][kn][3][0] * u[2] + squarelist[i][kn][3][1] * v[2] ]
-                    
-                    vert_str = "{:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}".format(
-                               vertex1[0], vertex1[1], vertex1[2],
-                               vertex2[0], vertex2[1], vertex2[2],
-                               vertex3[0], vertex3[1], vertex3[2],
-                               vertex4[0], vertex4[1], vertex4[2])
-                    countervert_str = "{:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}".format(
-                                      vertex1[0], vertex1[1], vertex1[2],
-                                      vertex4[0], vertex4[1], vertex4[2],
-                                      vertex3[0], vertex3[1], vertex3[2],
-                                      vertex2[0], vertex2[1], vertex2[2])
-                    
-                    # fill out the entries in the opening string definition
-                    single_opening_def = opening_str.replace('<IDX>', str(i)+'_'+str(pn)).replace('<BASESURFACE>', base_surface).replace('<VERTICES>', vert_str).replace('<COUNTERVERTICES>', countervert_str)
-                    idf_total_opening_def = idf_total_opening_def + single_opening_def
-
-                    # a new consecutive subsequence has just begun provided that k<len(insideindices[i])
-                    if k<len(insideindices[i]):
-                        pn = insideindices[i][k]
-                        kn = insideindices[i][k]
-     
-    # create idf opening objects from the string containing opening definitions   
-    from io import StringIO
-    idf_opening = IDF(StringIO(idf_total_opening_def))
-
-    # copy idf shading objects to the existing idf file
-    openings = idf_opening.idfobjects["FENESTRATIONSURFACE:DETAILED"]
-    for opening in openings:
-        idf_collection.copyidfobject(opening)
-    
-    ###############################
-    # at the end, save the changes
-    ###############################
-    idf_collection.save()
+
+    # the square (i,j) has its center at ((i+1)*squaresize, (j+1)*squaresize) in uv system,
+    # so find the range of squares whose centers may lie within the clipped opening
+    imin, jmin = np.ceil(clipped_uv.min(axis=0)/squaresize).astype(int) - 1
+    imax, jmax = np.floor(clipped_uv.max(axis=0)/squaresize).astype(int) - 1
+    if imax<imin or jmax<jmin:
+        return
+    jrange = np.arange(jmin, jmax+1)
+
+    opening_path = mplPath.Path(clipped_uv)
+    wall_path = mplPath.Path(wall_uv)
+    band = max(1, band_squares//len(jrange))
+
+    for band_start in range(imin, imax+1, band):
+        irange = np.arange(band_start, min(band_start+band, imax+1))
+
+        # for each square check whether its center belongs to the clipped opening
+        ci, cj = np.meshgrid((irange+1)*squaresize, (jrange+1)*squaresize, indexing='ij')
+        squarecenters = np.column_stack([ci.ravel(), cj.ravel()])
+        inside = opening_path.contains_points(squarecenters).reshape(len(irange), len(jrange))
+
+        # each square also has to lie within the wall, at least half a square away from its edges,
+        # which is checked for the square corners at ((i+0.5)*squaresize, (j+0.5)*squaresize)
+        ki, kj = np.meshgrid((np.arange(irange[0], irange[-1]+2)+0.5)*squaresize,
+                             (np.arange(jmin, jmax+2)+0.5)*squaresize, indexing='ij')
+        corners = np.column_stack([ki.ravel(), kj.ravel()])
+        corners_ok = wall_path.contains_points(corners) & \
+                     (edgedistance(corners, wall_uv) >= squaresize/2 - 1e-9)
+        corners_ok = corners_ok.reshape(len(irange)+1, len(jrange)+1)
+        inside &= corners_ok[:-1, :-1] & corners_ok[1:, :-1] & corners_ok[1:, 1:] & corners_ok[:-1, 1:]
+
+        # runs start where an inside square follows an outside one, and they end just before the opposite happens
+        steps = np.diff(np.pad(inside, ((0, 0), (1, 1))).astype(int), axis=1)
+        run_i, run_start = np.nonzero(steps==1)
+        run_end = np.nonzero(steps==-1)[1] - 1
+        if len(run_i)>0:
+            yield irange[run_i], jrange[run_start], jrange[run_end]
+
+# checks whether the 2d polygon, given as an n x 2 array, is convex
+def isconvex(polygon):
+    import numpy as np
+    edges = np.roll(polygon, -1, axis=0) - polygon
+    turns = edges[:, 0]*np.roll(edges, -1, axis=0)[:, 1] - edges[:, 1]*np.roll(edges, -1, axis=0)[:, 0]
+    return bool(np.all(turns>=0) or np.all(turns<=0))
+
+# distances of the 2d points, given as an m x 2 array, to the nearest edge of the 2d polygon
+def edgedistance(points, polygon):
+    import numpy as np
+    a = np.asarray(polygon, dtype=float)
+    b = np.roll(a, -1, axis=0)
+    ab = b - a
+    ap = points[:, None, :] - a[None, :, :]
+    t = np.clip(np.sum(ap*ab, axis=2)/np.sum(ab*ab, axis=1), 0.0, 1.0)
+    return np.min(np.linalg.norm(ap - t[:, :, None]*ab, axis=2), axis=1)
@@ -1,36 +1,44 @@
 # epnurbs.createshading module contains a method for creating approximation of a NURBS shading in EnergyPlus files
 
-from eppy import modeleditor
-from eppy.modeleditor import IDF
-
 from .helper_methods import crossproduct, normalize, distance, foot
-
-# the method for creating approximation of a NURBS shading
-def createnurbsshading(idd_filename, idf_filename, base_surface, shading_str, ctrl_points, evaluated_points=20):
+from .surfaceoutput import loadbasesurface, savesurfaces, appendsurfaces
+from .surfacemerge import mergecoplanarsurfaces
+
+# the method for creating approximation of a NURBS shading.
+# idf_filename may also be an .epJSON file, in which case the shadings are written to it directly.
+# if merge_tolerance is given, runs of adjacent trapezoids and triangles that lie in the same plane
+# within this distance are merged into single convex polygons before they are saved.
+# if append is True, the objects are written directly to the end of idf_filename as they are generated,
+# instead of being copied into the eppy model first, so that the memory used stays bounded.
+def createnurbsshading(idd_filename, idf_filename, base_surface, shading_str, ctrl_points, evaluated_points=20,
+                       merge_tolerance=None, append=False):
     ##########################################
     # loading base surface data from idf file 
     ##########################################
-    
-    # check if IDD has been already set
-    try:
-        IDF.setiddname(idd_filename)
-    except modeleditor.IDDAlreadySetError as e:
-        pass
-
-    # load idf file into idf collection
-    idf_collection = IDF(idf_filename)
-
-    # find the named base_surface in idf collection
-    walls = idf_collection.idfobjects['BuildingSurface:Detailed'.upper()]
-    for wall in walls:
-        if wall.Name == base_surface:
-            # named base_surface is now contained in wall
-            break
-    else:
-        # named base_surface was not found in idf file
-        print('epnurbs.createshading: unable to find the base surface', base_surface, 'in', idf_filename)
+    model, coord = loadbasesurface(idd_filename, idf_filename, base_surface, 'createshading')
+    if model is None:
         return
 
+    surfaces = nurbsshadingsurfaces(coord, ctrl_points, evaluated_points)
+
+    if merge_tolerance is not None:
+        surfaces = list(surfaces)
+        merged = mergecoplanarsurfaces(surfaces, merge_tolerance)
+        print('epnurbs.createshading: merged', len(surfaces), 'shading elements into', len(merged))
+        surfaces = merged
+
+    ##########################################################
+    # add shading objects to the model and at the end, save it
+    ##########################################################
+    if append:
+        appendsurfaces(model, idf_filename, shading_str, base_surface, surfaces, 'Shading:Zone:Detailed')
+    else:
+        savesurfaces(model, idf_filename, shading_str, base_surface, surfaces, 'Shading:Zone:Detailed')
+
+# the method for calculating vertices of trapezoids and triangles that approximate NURBS shading
+# for the base surface with coordinates coord.
+# yields an (idx, vertices, countervertices) triple for each shading element
+def nurbsshadingsurfaces(coord, ctrl_points, evaluated_points=20):
     #################################
     # calculating NURBS curve points
     #################################
@@ -65,8 +73,7 @@ def createnurbsshading(idd_filename, idf_filename, base_surface, shading_str, ct
     # feet of perpendiculars from the remaining NURBS curve points to the base surface
     ###################################################################################
 
-    # getting the found base_surface's coordinates
-    coord = wall.coords
+    # getting the base_surface's coordinates
     ulc = coord[0]
     blc = coord[1]
     brc = coord[2]
@@ -79,10 +86,9 @@ def createnurbsshading(idd_filename, idf_filename, base_surface, shading_str, ct
     # calculate feet of perpendiculars
     feet_points = [foot(crv_points[i], ulc, N) for i in range(len(crv_points))]
 
-    #################################################################################
-    # create string of idf definitions for trapezoids that approximate NURBS shading
-    #################################################################################
-    idf_total_shading_def = ""
+    ##############################################################
+    # yield trapezoids and triangles that approximate NURBS shading
+    ##############################################################
     for i in range(1, len(crv_points)):
         # the width of a trapezoid must be at least 0.01
         if distance(crv_points[i-1], crv_points[i])>=0.01 and \
@@ -91,58 +97,18 @@ def createnurbsshading(idd_filename, idf_filename, base_surface, shading_str, ct
             if distance(crv_points[i-1], feet_points[i-1])>=0.01:
                 if distance(crv_points[i], feet_points[i])>=0.01:
                     # both arms are at least 0.01, so we have a trapezoid
-                    vertices_str = "{:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}".format(
-                                   feet_points[i-1][0], feet_points[i-1][1], feet_points[i-1][2],
-                                   crv_points[i-1][0],  crv_points[i-1][1],  crv_points[i-1][2],
-                                   crv_points[i][0],    crv_points[i][1],    crv_points[i][2],
-                                   feet_points[i][0],   feet_points[i][1],   feet_points[i][2])
-                    countervertices_str = "{:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}".format(
-                                          feet_points[i][0],   feet_points[i][1],   feet_points[i][2],
-                                          crv_points[i][0],    crv_points[i][1],    crv_points[i][2],
-                                          crv_points[i-1][0],  crv_points[i-1][1],  crv_points[i-1][2],
-                                          feet_points[i-1][0], feet_points[i-1][1], feet_points[i-1][2])
-                    single_shading_def = shading_str.replace('<IDX>', str(i)).replace('<BASESURFACE>', base_surface).replace('<VERTICES>', vertices_str).replace('<COUNTERVERTICES>', countervertices_str)
-                    idf_total_shading_def = idf_total_shading_def + single_shading_def
+                    yield (i, [feet_points[i-1], crv_points[i-1], crv_points[i], feet_points[i]],
+                              [feet_points[i], crv_points[i], crv_points[i-1], feet_points[i-1]])
                 else: 
                     # arm i is less than 0.01, so we have a triangle
-                    vertices_str = "{:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}".format(
-                                   feet_points[i-1][0], feet_points[i-1][1], feet_points[i-1][2],
-                                   crv_points[i-1][0],  crv_points[i-1][1],  crv_points[i-1][2],
-                                   feet_points[i][0],   feet_points[i][1],   feet_points[i][2])
-                    countervertices_str = "{:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}".format(
-                                          feet_points[i][0],   feet_points[i][1],   feet_points[i][2], 
-                                          crv_points[i-1][0],  crv_points[i-1][1],  crv_points[i-1][2],
-                                          feet_points[i-1][0], feet_points[i-1][1], feet_points[i-1][2])               
-                    single_shading_def = shading_str.replace('<IDX>', str(i)).replace('<BASESURFACE>', base_surface).replace('<VERTICES>', vertices_str).replace('<COUNTERVERTICES>', countervertices_str)
-                    idf_total_shading_def = idf_total_shading_def + single_shading_def
+                    yield (i, [feet_points[i-1], crv_points[i-1], feet_points[i]],
+                              [feet_points[i], crv_points[i-1], feet_points[i-1]])
             else:
                 # arm i-1 is less than 0.01, but do we still have a triangle?
                 if distance(crv_points[i], feet_points[i])>=0.01:
                     # we have a triangle
-                    vertices_str = "{:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}".format(
-                                   feet_points[i-1][0], feet_points[i-1][1], feet_points[i-1][2],
-                                   crv_points[i][0],    crv_points[i][1],    crv_points[i][2],
-                                   feet_points[i][0],   feet_points[i][1],   feet_points[i][2])
-                    countervertices_str = "{:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}, {:f}".format(
-                                          feet_points[i][0],   feet_points[i][1],   feet_points[i][2],
-                                          crv_points[i][0],    crv_points[i][1],    crv_points[i][2],
-                                          feet_points[i-1][0], feet_points[i-1][1], feet_points[i-1][2])              
-                    single_shading_def = shading_str.replace('<IDX>', str(i)).replace('<BASESURFACE>', base_surface).replace('<VERTICES>', vertices_str).replace('<COUNTERVERTICES>', countervertices_str)
-                    idf_total_shading_def = idf_total_shading_def + single_shading_def
+                    yield (i, [feet_points[i-1], crv_points[i], feet_points[i]],
+                              [feet_points[i], crv_points[i], feet_points[i-1]])
                 else:
                     # we do not have a shading element in this case
                     pass
-    
-    # create idf shading objects from the string containing shading definitions   
-    from io import StringIO
-    idf_shading = IDF(StringIO(idf_total_shading_def))
-
-    # copy idf shading objects to the existing idf file
-    shadings = idf_shading.idfobjects["SHADING:ZONE:DETAILED"]
-    for shading in shadings:
-        idf_collection.copyidfobject(shading)
-
-    ###############################
-    # at the end, save the changes
-    ###############################
-    idf_collection.save()
@@ -0,0 +1,162 @@
+# epnurbs.epjsonoutput module contains methods for writing generated surfaces directly to EnergyPlus .epJSON files
+# without converting them to idf text and parsing them with eppy first
+
+import json
+
+# epJSON keys of the fields that come between the object name and its vertices,
+# in the same order as they appear in the idf definition of each supported object
+epjson_fields = {
+    'Shading:Site:Detailed': ['transmittance_schedule_name', 'number_of_vertices'],
+    'Shading:Building:Detailed': ['transmittance_schedule_name', 'number_of_vertices'],
+    'Shading:Zone:Detailed': ['base_surface_name', 'transmittance_schedule_name', 'number_of_vertices'],
+    'FenestrationSurface:Detailed': ['surface_type', 'construction_name', 'building_surface_name',
+                                     'outside_boundary_condition_object', 'view_factor_to_ground',
+                                     'frame_and_divider_name', 'multiplier', 'number_of_vertices'],
+}
+
+# shading objects keep their vertices in an extensible 'vertices' array,
+# while fenestration surfaces have at most four vertices stored in separate numbered fields
+epjson_vertex_arrays = {
+    'Shading:Site:Detailed': True,
+    'Shading:Building:Detailed': True,
+    'Shading:Zone:Detailed': True,
+    'FenestrationSurface:Detailed': False,
+}
+
+# checks whether the given file name refers to an epJSON file
+def isepjson(filename):
+    return str(filename).lower().endswith('.epjson')
+
+# loads the whole epJSON model as a dictionary
+def loadepjson(epjson_filename):
+    with open(epjson_filename, 'r') as f:
+        return json.load(f)
+
+# saves the epJSON model dictionary back to the file
+def saveepjson(epjson_model, epjson_filename):
+    with open(epjson_filename, 'w') as f:
+        json.dump(epjson_model, f, indent=4)
+
+# returns the list of [x, y, z] vertices of the epJSON object,
+# which are kept either in the 'vertices' array or in the separate numbered vertex fields
+def getepjsonvertices(epjson_obj):
+    if 'vertices' in epjson_obj:
+        return [ [vertex['vertex_x_coordinate'], vertex['vertex_y_coordinate'], vertex['vertex_z_coordinate']]
+                 for vertex in epjson_obj['vertices'] ]
+
+    points = []
+    while 'vertex_{}_x_coordinate'.format(len(points)+1) in epjson_obj:
+        k = len(points)+1
+        points.append( [epjson_obj['vertex_{}_{}_coordinate'.format(k, axis)] for axis in 'xyz'] )
+    return points
+
+# returns the list of vertices of the named BuildingSurface:Detailed object from the epJSON model,
+# or None if there is no such surface
+def findepjsonsurface(epjson_model, base_surface):
+    walls = epjson_model.get('BuildingSurface:Detailed', {})
+    if base_surface not in walls:
+        return None
+
+    return getepjsonvertices(walls[base_surface])
+
+# returns the exact epJSON name of the object type given in any letter case, or None if it is not supported
+def epjsontype(object_type):
+    for epjson_type in epjson_fields:
+        if epjson_type.upper()==object_type.upper():
+            return epjson_type
+    return None
+
+# epJSON keys of the numeric fields, whose values are written as numbers,
+# while the values of all other fields, such as names, stay strings
+epjson_numeric_fields = ['view_factor_to_ground', 'multiplier', 'number_of_vertices']
+
+# converts a single idf field value from the template into its epJSON counterpart for the given key,
+# numbers in numeric fields become numbers, while empty fields are left out
+def epjsonvalue(key, value):
+    from math import isfinite
+
+    if value=='':
+        return None
+    if key not in epjson_numeric_fields:
+        return value
+    try:
+        number = float(value)
+    except ValueError:
+        # keywords such as autocalculate
+        return value
+    if not isfinite(number):
+        return value
+    return int(number) if number.is_integer() else number
+
+# splits the idf template into a list of objects,
+# each of which is a list of its stripped fields with idf comments removed
+def parsetemplate(template_str):
+    text = '\n'.join(line.split('!')[0] for line in template_str.splitlines())
+    return [ [field.strip() for field in obj.split(',')] for obj in text.split(';') if obj.strip() ]
+
+# builds epJSON objects from the idf template for each generated surface and
+# merges them into epjson_model, replacing any existing objects with the same names.
+# unlike in idf files, where such objects are kept and reported later by EnergyPlus,
+# each replaced object is reported here, since it disappears from the model.
+# surfaces is an iterable of (idx, vertices, countervertices) triples, where vertices are lists of [x, y, z] points.
+# the template may contain several objects, and it uses the same placeholders
+# <IDX>, <BASESURFACE>, <VERTICES> and <COUNTERVERTICES> as the idf templates do,
+# but objects other than object_type are ignored.
+# returns the number of added objects.
+def addepjsonsurfaces(epjson_model, template_str, base_surface, surfaces, object_type):
+    # epJSON object type names are case sensitive, so recover the exact name from the known ones
+    epjson_type = epjsontype(object_type)
+    if epjson_type is None:
+        print('epnurbs.epjsonoutput: unsupported object type', object_type)
+        return 0
+
+    keys = epjson_fields[epjson_type]
+
+    # keep only the template objects of the requested type and find where their vertices start
+    template_objects = []
+    for obj in parsetemplate(template_str):
+        if obj[0].upper()!=epjson_type.upper():
+            continue
+        for vidx in range(2, len(obj)):
+            if obj[vidx] in ('<VERTICES>', '<COUNTERVERTICES>'):
+                break
+        else:
+            print('epnurbs.epjsonoutput: no vertices placeholder in template object', obj[1])
+            continue
+        # fields are matched to epJSON keys by their positions, so their numbers have to agree,
+        # which is not the case for templates written for other EnergyPlus versions
+        if vidx-2!=len(keys):
+            print('epnurbs.epjsonoutput: template object', obj[1], 'has', vidx-2, 'fields before the vertices,',
+                  'while', epjson_type, 'has', len(keys))
+            continue
+        template_objects.append( (obj[1], obj[2:vidx], obj[vidx]=='<COUNTERVERTICES>') )
+
+    new_objects = epjson_model.setdefault(epjson_type, {})
+    count = 0
+    for idx, vertices, countervertices in surfaces:
+        for name_str, field_values, counter in template_objects:
+            points = countervertices if counter else vertices
+
+            epjson_obj = {}
+            for key, value in zip(keys, field_values):
+                value = epjsonvalue(key, value.replace('<IDX>', str(idx)).replace('<BASESURFACE>', base_surface))
+                if value is not None:
+                    epjson_obj[key] = value
+            epjson_obj['number_of_vertices'] = len(points)
+
+            # vertices are serialized in bulk, as a single list or a single dictionary update
+            if epjson_vertex_arrays[epjson_type]:
+                epjson_obj['vertices'] = [ {'vertex_x_coordinate': float(p[0]),
+                                            'vertex_y_coordinate': float(p[1]),
+                                            'vertex_z_coordinate': float(p[2])} for p in points ]
+            else:
+                epjson_obj.update( ('vertex_{}_{}_coordinate'.format(k+1, axis), float(p[a]))
+                                   for k, p in enumerate(points) for a, axis in enumerate('xyz') )
+
+            name = name_str.replace('<IDX>', str(idx)).replace('<BASESURFACE>', base_surface)
+            if name in new_objects:
+                print('epnurbs.epjsonoutput: replacing the existing', epjson_type, 'object', name)
+            new_objects[name] = epjson_obj
+            count += 1
+
+    return count
@@ -1,4 +1,4 @@
-# epnurbs.helper_methods module contains a few helper methods for 3d vector calculations
+# epnurbs.helper_methods module contains a few helper methods for 3d vector and 2d polygon calculations
 
 def subtract(u,v):
     return [ u[0]-v[0], u[1]-v[1], u[2]-v[2] ]
@@ -29,3 +29,66 @@ def distance(a,b):
 def foot(x, p, n):
     s = (x[0]-p[0])*n[0] + (x[1]-p[1])*n[1] + (x[2]-p[2])*n[2]
     return [ x[0] - s*n[0], x[1] - s*n[1], x[2] - s*n[2] ]
+
+
+# normal vector of a planar polygon given by the list of its vertices, calculated by Newell's method
+# the normal is not normalised: its length is equal to twice the area of the polygon
+def polygonnormal(points):
+    n = [0.0, 0.0, 0.0]
+    for k in range(len(points)):
+        p = points[k]
+        q = points[(k+1) % len(points)]
+        n[0] += (p[1]-q[1]) * (p[2]+q[2])
+        n[1] += (p[2]-q[2]) * (p[0]+q[0])
+        n[2] += (p[0]-q[0]) * (p[1]+q[1])
+    return n
+
+def polygonarea(points):
+    return length(polygonnormal(points))/2
+
+# the first edge of the polygon that is not degenerate, as the vector from its first to its second vertex,
+# so that repeated vertices at the start of the polygon are skipped
+def firstedge(points):
+    for k in range(1, len(points)):
+        u = subtract(points[k], points[k-1])
+        if length(u)>1e-9:
+            return u
+    return subtract(points[0], points[-1])
+
+# signed area of the 2d polygon, positive for counterclockwise orientation
+def area2d(poly):
+    return sum(poly[k][0]*poly[(k+1) % len(poly)][1] - poly[(k+1) % len(poly)][0]*poly[k][1]
+               for k in range(len(poly)))/2 if len(poly)>2 else 0.0
+
+# clips the 2d polygon subject with the convex 2d polygon clip by Sutherland-Hodgman algorithm
+def clipconvex(subject, clip):
+    if area2d(clip)<0:
+        clip = clip[::-1]
+
+    output = list(subject)
+    for k in range(len(clip)):
+        if len(output)==0:
+            break
+        c1 = clip[k]
+        c2 = clip[(k+1) % len(clip)]
+
+        # positive side of the edge c1-c2 is the inside of the counterclockwise polygon clip
+        side = lambda p: (c2[0]-c1[0])*(p[1]-c1[1]) - (c2[1]-c1[1])*(p[0]-c1[0])
+
+        inputs = output
+        output = []
+        for m in range(len(inputs)):
+            p = inputs[m-1]
+            q = inputs[m]
+            sp = side(p)
+            sq = side(q)
+            if sq>=0:
+                if sp<0:
+                    s = sp/(sp-sq)
+                    output.append( (p[0]+s*(q[0]-p[0]), p[1]+s*(q[1]-p[1])) )
+                output.append(q)
+            elif sp>=0:
+                s = sp/(sp-sq)
+                output.append( (p[0]+s*(q[0]-p[0]), p[1]+s*(q[1]-p[1])) )
+
+    return output
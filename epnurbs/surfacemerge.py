@@ -0,0 +1,96 @@
+# epnurbs.surfacemerge module contains a method for merging adjacent coplanar surfaces
+# into single polygons, in order to reduce the number of surfaces in EnergyPlus files
+
+from .helper_methods import subtract, dotproduct, crossproduct, length, normalize, distance, polygonnormal
+
+# EnergyPlus does not accept surfaces with more vertices than this
+max_surface_vertices = 120
+
+# the method for merging runs of consecutive surfaces that lie in the same plane within the distance tol.
+# surfaces is a list of (idx, vertices, countervertices) triples, where countervertices are reversed vertices,
+# such as those from nurbsshadingsurfaces, in which two consecutive surfaces share an edge
+# that is made of the last two vertices of the first surface and the first two vertices of the second surface.
+# a surface is merged with the previous ones only if the merged polygon stays convex,
+# it does not have more than max_vertices vertices, and all original vertices of the run
+# lie within the distance tol of its boundary.
+# returns the list of merged surfaces, each of which keeps the idx of the first surface in its run.
+def mergecoplanarsurfaces(surfaces, tol=0.001, max_vertices=max_surface_vertices):
+    merged = []
+    # all original vertices of the current run, in the order of the merged polygon
+    outline = None
+    for idx, vertices, countervertices in surfaces:
+        if len(merged)>0:
+            result = mergepolygons(outline, vertices, tol, max_vertices)
+            if result is not None:
+                outline, polygon = result
+                merged[-1] = (merged[-1][0], polygon, polygon[::-1])
+                continue
+        merged.append( (idx, vertices, countervertices) )
+        outline = vertices
+
+    return merged
+
+# merges the polygon b with the outline a of the current run along their shared edge a[-2], a[-1] == b[1], b[0].
+# returns the pair (outline, polygon) made of the merged outline with all original vertices
+# and the merged polygon with simplified edges, or None if the polygons cannot be merged.
+def mergepolygons(a, b, tol, max_vertices):
+    if distance(a[-1], b[0])>tol or distance(a[-2], b[1])>tol:
+        return None
+
+    # the merged outline goes around both polygons, so that the shared vertex a[-1] comes first,
+    # while the last two vertices make the edge that may be shared with the next polygon
+    outline = [a[-1]] + a[:-1] + b[2:]
+
+    # all original vertices have to lie in the same plane
+    n = polygonnormal(outline)
+    if length(n)<tol*tol:
+        return None
+    n = normalize(n)
+    if any(abs(dotproduct(subtract(p, outline[0]), n))>tol for p in outline):
+        return None
+
+    polygon = simplifypolygon(outline, tol)
+    if len(polygon)>max_vertices:
+        return None
+
+    # and the polygon has to turn in the same direction at each vertex
+    for k in range(len(polygon)):
+        p = polygon[k-1]
+        q = polygon[k]
+        r = polygon[(k+1) % len(polygon)]
+        if dotproduct(crossproduct(subtract(q, p), subtract(r, q)), n)<=0:
+            return None
+
+    return outline, polygon
+
+# simplifies the polygon by Douglas-Peucker algorithm, so that each removed vertex lies
+# within the distance tol of the edge that replaces it, while the last two vertices are always kept.
+# the polygon is treated as the chain from its last vertex, around through the first one, to the last but one.
+def simplifypolygon(polygon, tol):
+    chain = [polygon[-1]] + polygon[:-1]
+    keep = [False]*len(chain)
+    keep[0] = keep[-1] = True
+
+    ranges = [(0, len(chain)-1)]
+    while len(ranges)>0:
+        first, last = ranges.pop()
+        far, far_distance = None, tol
+        for k in range(first+1, last):
+            d = segmentdistance(chain[k], chain[first], chain[last])
+            if d>far_distance:
+                far, far_distance = k, d
+        if far is not None:
+            keep[far] = True
+            ranges.append( (first, far) )
+            ranges.append( (far, last) )
+
+    chain = [chain[k] for k in range(len(chain)) if keep[k]]
+    return chain[1:] + chain[:1]
+
+# distance from the point p to the segment between a and b
+def segmentdistance(p, a, b):
+    ab = subtract(b, a)
+    ap = subtract(p, a)
+    ab2 = dotproduct(ab, ab)
+    t = min(max(dotproduct(ap, ab)/ab2, 0.0), 1.0) if ab2>0 else 0.0
+    return distance(p, [a[0]+t*ab[0], a[1]+t*ab[1], a[2]+t*ab[2]])
@@ -0,0 +1,146 @@
+# epnurbs.surfaceoutput module contains methods shared by all surface generators
+# for loading the base surface from and saving the generated surfaces to EnergyPlus files.
+# files with .epJSON extension are handled directly as json, while all other files are handled by eppy.
+
+from eppy import modeleditor
+from eppy.modeleditor import IDF
+
+from .epjsonoutput import isepjson, loadepjson, saveepjson, epjsontype, getepjsonvertices, findepjsonsurface, \
+                          addepjsonsurfaces
+
+# formats the list of [x, y, z] points as a comma separated list of idf vertex coordinates
+def vertices_str(points):
+    return ", ".join("{:f}, {:f}, {:f}".format(p[0], p[1], p[2]) for p in points)
+
+# loads the model from model_filename, either as an epJSON dictionary or as an eppy idf collection
+def loadmodel(idd_filename, model_filename):
+    if isepjson(model_filename):
+        # load the epJSON model as a plain dictionary, no idd is needed in this case
+        return loadepjson(model_filename)
+
+    # check if IDD has been already set
+    try:
+        IDF.setiddname(idd_filename)
+    except modeleditor.IDDAlreadySetError as e:
+        pass
+
+    # load idf file into idf collection
+    return IDF(model_filename)
+
+# saves the model loaded by loadmodel back to model_filename
+def savemodel(model, model_filename):
+    if isepjson(model_filename):
+        saveepjson(model, model_filename)
+    else:
+        model.save()
+
+# loads the model from model_filename and finds the coordinates of the named base_surface in it.
+# returns the pair (model, coordinates), or (None, None) if the base surface cannot be found.
+# caller is the name of the generator method, used in error messages.
+def loadbasesurface(idd_filename, model_filename, base_surface, caller):
+    model = loadmodel(idd_filename, model_filename)
+
+    if isepjson(model_filename):
+        coord = findepjsonsurface(model, base_surface)
+        if coord is not None:
+            return model, coord
+    else:
+        # find the named base_surface in idf collection
+        walls = model.idfobjects['BuildingSurface:Detailed'.upper()]
+        for wall in walls:
+            if wall.Name == base_surface:
+                # named base_surface is now contained in wall
+                return model, wall.coords
+
+    # named base_surface was not found in the model
+    print('epnurbs.'+caller+': unable to find the base surface', base_surface, 'in', model_filename)
+    return None, None
+
+# returns the list of (name, vertices) pairs for all objects of the given object_type in the model
+def getmodelsurfaces(model, model_filename, object_type):
+    if isepjson(model_filename):
+        objects = model.get(epjsontype(object_type), {})
+        return [ (name, getepjsonvertices(obj)) for name, obj in objects.items() ]
+
+    return [ (obj.Name, [list(p) for p in obj.coords]) for obj in model.idfobjects[object_type.upper()] ]
+
+# removes the objects of the given object_type from the model,
+# where indices are their positions in the list returned by getmodelsurfaces
+def removemodelsurfaces(model, model_filename, object_type, indices):
+    if isepjson(model_filename):
+        objects = model.get(epjsontype(object_type), {})
+        names = list(objects)
+        for k in indices:
+            del objects[names[k]]
+        return
+
+    objects = model.idfobjects[object_type.upper()]
+    for obj in [objects[k] for k in indices]:
+        model.removeidfobject(obj)
+
+# number of idf objects that are parsed by eppy at once before they are copied to the model
+chunk_objects = 1000
+
+# yields the idf definitions of the generated surfaces one by one,
+# by filling out the placeholders in template_str for each (idx, vertices, countervertices) triple in surfaces,
+# which may be any iterable, so that the surfaces can be generated on the fly
+def surfaceobjects(template_str, base_surface, surfaces):
+    for idx, vertices, countervertices in surfaces:
+        yield template_str.replace('<IDX>', str(idx)).replace('<BASESURFACE>', base_surface) \
+                          .replace('<VERTICES>', vertices_str(vertices)) \
+                          .replace('<COUNTERVERTICES>', vertices_str(countervertices))
+
+# keeps only the objects of the given object_type in the idf template, without idf comments,
+# since only these objects are added to the model by savesurfaces
+def templateobjects(template_str, object_type):
+    text = '\n'.join(line.split('!')[0] for line in template_str.splitlines())
+    objects = [ obj.strip() for obj in text.split(';') if obj.split(',')[0].strip().upper()==object_type.upper() ]
+    return "".join(obj+';\n' for obj in objects)
+
+# adds the generated surfaces of the given object_type to the model and saves the model to model_filename.
+# surfaces may be any iterable, which is consumed incrementally:
+# idf definitions are parsed and copied to the model in chunks of chunk_objects,
+# so that only a single chunk of them exists as text and as a temporary idf collection at any time.
+def savesurfaces(model, model_filename, template_str, base_surface, surfaces, object_type):
+    if isepjson(model_filename):
+        # epJSON objects are built directly from the vertices, without eppy round trip
+        addepjsonsurfaces(model, template_str, base_surface, surfaces, object_type)
+    else:
+        from io import StringIO
+        from itertools import islice
+
+        objects = surfaceobjects(template_str, base_surface, surfaces)
+        while True:
+            # create idf objects from the string containing the definitions of the next chunk
+            chunk_str = "".join(islice(objects, chunk_objects))
+            if chunk_str=="":
+                break
+            idf_new = IDF(StringIO(chunk_str))
+
+            # copy idf objects to the existing idf file
+            for obj in idf_new.idfobjects[object_type.upper()]:
+                model.copyidfobject(obj)
+
+    ###############################
+    # at the end, save the changes
+    ###############################
+    savemodel(model, model_filename)
+
+# adds the generated surfaces to the model file in bulk, without copying them into the model one by one first.
+# epJSON models are merged and saved as in savesurfaces, while for idf files
+# the definitions of the objects of the given object_type from template_str are written directly to the end of the file
+# as the surfaces are generated, so that the memory used does not grow with the number of surfaces
+# (note also that eppy needs many seconds to parse, copy and save tens of thousands of objects).
+def appendsurfaces(model, model_filename, template_str, base_surface, surfaces, object_type):
+    if isepjson(model_filename):
+        addepjsonsurfaces(model, template_str, base_surface, surfaces, object_type)
+        saveepjson(model, model_filename)
+        return
+
+    # the same objects as in savesurfaces are written, regardless of the other objects in the template
+    template_str = templateobjects(template_str, object_type)
+
+    with open(model_filename, 'a') as f:
+        f.write('\n')
+        for object_str in surfaceobjects(template_str, base_surface, surfaces):
+            f.write(object_str)
@@ -0,0 +1,154 @@
+# epnurbs.surfaceoverlap module contains methods for detecting generated surfaces
+# that overlap, intersect or duplicate each other in EnergyPlus files
+
+from .helper_methods import subtract, dotproduct, crossproduct, length, normalize, distance, polygonnormal, \
+                            area2d, clipconvex
+from .surfaceoutput import loadmodel, savemodel, getmodelsurfaces, removemodelsurfaces
+
+# the method for checking the generated surfaces of the given object_type in the model for overlaps.
+# surfaces coming from several calls of createrectshading/createnurbsshading/createnurbsopening,
+# for the same or the neighbouring walls, are all checked against each other.
+# each found pair is reported and returned as the (name1, name2, kind) triple, where kind is
+#   'duplicate' - the two surfaces have the same vertices in the same order,
+#   'overlap'   - the two surfaces lie in the same plane and share a part of positive area,
+#   'intersect' - the two surfaces lie in different planes and pass through each other.
+# pairs of surfaces with the same vertices in the opposite order are not reported,
+# as they are produced on purpose by templates with <COUNTERVERTICES>.
+# if prune_duplicates is True, the latter surface of each duplicate pair is removed and the model is saved.
+def checkoverlaps(idd_filename, model_filename, object_type='Shading:Zone:Detailed', tol=0.001, prune_duplicates=False):
+    model = loadmodel(idd_filename, model_filename)
+    surfaces = getmodelsurfaces(model, model_filename, object_type)
+
+    overlaps = findoverlaps([vertices for name, vertices in surfaces], tol)
+    for k, m, kind in overlaps:
+        print('epnurbs.checkoverlaps:', surfaces[k][0], 'and', surfaces[m][0], 'are duplicates' if kind=='duplicate' else kind)
+
+    if prune_duplicates:
+        # surfaces are identified by their positions, as idf files may contain several surfaces with the same name
+        duplicates = set(m for k, m, kind in overlaps if kind=='duplicate')
+        if len(duplicates)>0:
+            removemodelsurfaces(model, model_filename, object_type, duplicates)
+            savemodel(model, model_filename)
+            print('epnurbs.checkoverlaps: removed', len(duplicates), 'duplicate surfaces from', model_filename)
+
+    return [ (surfaces[k][0], surfaces[m][0], kind) for k, m, kind in overlaps ]
+
+# finds all pairs of overlapping polygons from the list polygons, each given by the list of its vertices.
+# returns the list of (k, m, kind) triples, where k<m are the positions of overlapping polygons in the list.
+# the polygons are first put in a uniform grid of cells according to their bounding boxes,
+# so that only the polygons sharing a cell are compared with each other,
+# which keeps the number of comparisons close to linear in the number of polygons.
+def findoverlaps(polygons, tol=0.001):
+    if len(polygons)<2:
+        return []
+
+    boxes = [boundingbox(vertices, tol) for vertices in polygons]
+
+    # the cell size is the average largest extent of a bounding box,
+    # so that a typical surface occupies only a few cells
+    cellsize = sum(max(bmax[a]-bmin[a] for a in range(3)) for bmin, bmax in boxes)/len(boxes)
+    cellsize = max(cellsize, 10*tol)
+
+    grid = {}
+    for k, (bmin, bmax) in enumerate(boxes):
+        lo = [int(bmin[a]//cellsize) for a in range(3)]
+        hi = [int(bmax[a]//cellsize) for a in range(3)]
+        for cx in range(lo[0], hi[0]+1):
+            for cy in range(lo[1], hi[1]+1):
+                for cz in range(lo[2], hi[2]+1):
+                    grid.setdefault((cx, cy, cz), []).append(k)
+
+    # collect candidate pairs from the shared cells
+    candidates = set()
+    for cell in grid.values():
+        for p in range(len(cell)):
+            for q in range(p+1, len(cell)):
+                candidates.add( (cell[p], cell[q]) )
+
+    overlaps = []
+    for k, m in sorted(candidates):
+        if not boxesintersect(boxes[k], boxes[m]):
+            continue
+        kind = overlaptype(polygons[k], polygons[m], tol)
+        if kind is not None:
+            overlaps.append( (k, m, kind) )
+
+    return overlaps
+
+# bounding box of the list of points, enlarged by tol in each direction
+def boundingbox(points, tol=0.0):
+    bmin = [min(p[a] for p in points)-tol for a in range(3)]
+    bmax = [max(p[a] for p in points)+tol for a in range(3)]
+    return bmin, bmax
+
+def boxesintersect(box1, box2):
+    return all(box1[0][a]<=box2[1][a] and box2[0][a]<=box1[1][a] for a in range(3))
+
+# checks whether the polygon b has the same vertices as the polygon a,
+# in the same cyclic order, up to the distance tol
+def samepolygon(a, b, tol):
+    if len(a)!=len(b):
+        return False
+    for k in range(len(b)):
+        if distance(a[0], b[k])<=tol:
+            return all(distance(a[i], b[(k+i) % len(b)])<=tol for i in range(len(a)))
+    return False
+
+# determines the kind of overlap between two convex planar polygons a and b,
+# or returns None if they do not overlap
+def overlaptype(a, b, tol):
+    if samepolygon(a, b, tol):
+        return 'duplicate'
+    if samepolygon(a, b[::-1], tol):
+        # counter surface, created on purpose
+        return None
+
+    na = polygonnormal(a)
+    nb = polygonnormal(b)
+    if length(na)<tol*tol or length(nb)<tol*tol:
+        # degenerate polygon without area
+        return None
+    na = normalize(na)
+    nb = normalize(nb)
+
+    # signed distances of the vertices of one polygon from the plane of the other
+    db = [dotproduct(subtract(p, a[0]), na) for p in b]
+    da = [dotproduct(subtract(p, b[0]), nb) for p in a]
+
+    if all(abs(d)<=tol for d in db):
+        # coplanar polygons overlap if their intersection has positive area
+        e1 = normalize(subtract(a[1], a[0]))
+        e2 = crossproduct(na, e1)
+        a2 = [ (dotproduct(subtract(p, a[0]), e1), dotproduct(subtract(p, a[0]), e2)) for p in a ]
+        b2 = [ (dotproduct(subtract(p, a[0]), e1), dotproduct(subtract(p, a[0]), e2)) for p in b ]
+        if abs(area2d(clipconvex(b2, a2)))>tol*tol:
+            return 'overlap'
+        return None
+
+    # polygons in different planes pass through each other
+    # only if each of them has vertices strictly on both sides of the other's plane
+    if min(da)>=-tol or max(da)<=tol or min(db)>=-tol or max(db)<=tol:
+        return None
+
+    # both polygons cut the intersection line of the two planes in a segment,
+    # and they intersect if these two segments overlap
+    line = normalize(crossproduct(na, nb))
+    seg_a = planecut(a, da, line)
+    seg_b = planecut(b, db, line)
+    if min(seg_a[1], seg_b[1]) - max(seg_a[0], seg_b[0]) > tol:
+        return 'intersect'
+    return None
+
+# the interval along the direction line that the polygon with
+# signed vertex distances d from the other plane cuts on that plane
+def planecut(poly, d, line):
+    ts = []
+    for k in range(len(poly)):
+        m = (k+1) % len(poly)
+        if d[k]==0:
+            ts.append(dotproduct(poly[k], line))
+        elif d[k]*d[m]<0:
+            s = d[k]/(d[k]-d[m])
+            p = [poly[k][a] + s*(poly[m][a]-poly[k][a]) for a in range(3)]
+            ts.append(dotproduct(p, line))
+    return min(ts), max(ts)
@@ -129,5 +129,5 @@ setup(
     #
     # For an analysis of "install_requires" vs pip's requirements files see:
     # https://packaging.python.org/en/latest/requirements.html
-    install_requires=['eppy', 'NURBS-Python'],  # Optional
+    install_requires=['eppy', 'NURBS-Python', 'numpy'],  # Optional
 )